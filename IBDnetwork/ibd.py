@@ -1,283 +1,452 @@
 #!/usr/bin/env python3
 
 import sys, csv, argparse
-from collections import defaultdict, namedtuple
+from array import array
+from collections import namedtuple
 
-Row = namedtuple("Row", "region chr start end length a b ident")
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+except ImportError:
+    # pyarrow is optional: without it the table is parsed with the csv module
+    pa = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    # numba is optional: the kernels below are plain Python/numpy and run unjitted
+    def njit(*args, **kwargs):
+        return args[0] if args and callable(args[0]) else (lambda f: f)
+    prange = range
+
+# parsed pairwise table: one numpy array per column; chr/a/b hold categorical codes
+# into the chroms/haps name arrays
+Table = namedtuple("Table", "chr start end length a b ident chroms haps")
 
 def parse_table(path, identity_col="estimated.identity"):
     req = {"REGION","CHR","START","END","LENGTH","group.a","group.b",identity_col}
-    rows = []
     with open(path, newline="") as fh:
-        dr = csv.DictReader(fh, delimiter="\t")
-        if not dr.fieldnames or not set(dr.fieldnames).issuperset(req):
-            raise SystemExit(f"Error: missing columns in {path}. Required: {sorted(req)}")
-        for r in dr:
+        header = next(csv.reader(fh, delimiter="\t"), None)
+    if not header or not set(header).issuperset(req):
+        raise SystemExit(f"Error: missing columns in {path}. Required: {sorted(req)}")
+    if pa is None:
+        return _parse_table_py(path, identity_col)
+    names = pa.dictionary(pa.int32(), pa.string())
+    types = {"CHR": names, "START": pa.int64(), "END": pa.int64(), "LENGTH": pa.int64(),
+             "group.a": names, "group.b": names, identity_col: pa.float64()}
+    pos = {h: i for i, h in enumerate(header)}
+    last_req = max(pos[c] for c in types)  # a line shorter than this lacks a parsed column
+    try:
+        t = pacsv.read_csv(
+            path,
+            # skip lines missing a required column; the per-row parser keeps any other line
+            # with a wrong field count (extra fields, or only trailing optional ones missing)
+            parse_options=pacsv.ParseOptions(delimiter="\t", invalid_row_handler=lambda row:
+                "skip" if row.actual_columns <= last_req else "error"),
+            # only empty fields are null ("nan" stays a called NaN identity)
+            convert_options=pacsv.ConvertOptions(column_types=types, include_columns=list(types),
+                                                 null_values=[""]),
+        )
+    except pa.ArrowInvalid:
+        # some field does not convert (e.g. non-numeric START) or a line has a field count
+        # the per-row parser accepts: fall back to it
+        return _parse_table_py(path, identity_col)
+    t = t.drop_null()  # empty fields, skipped like malformed lines
+    col = lambda c: t[c].to_numpy()
+    cat = lambda c: t[c].to_pandas()
+    return encode_table(cat("CHR"), col("START"), col("END"), col("LENGTH"),
+                        cat("group.a"), cat("group.b"), col(identity_col))
+
+def _parse_table_py(path, identity_col):
+    chrs, a, b = [], [], []
+    # typed buffers for the numeric columns, no boxed Python objects per row
+    starts, ends, lengths, ident = array("q"), array("q"), array("q"), array("d")
+    with open(path, newline="") as fh:
+        reader = csv.reader(fh, delimiter="\t")
+        pos = {h: i for i, h in enumerate(next(reader))}
+        iC, iS, iE, iL, iA, iB, iI = (pos[c] for c in ("CHR","START","END","LENGTH","group.a","group.b",identity_col))
+        for r in reader:
             try:
-                rows.append(
-                    Row(
-                        region=r["REGION"],
-                        chr=r["CHR"],
-                        start=int(r["START"]),
-                        end=int(r["END"]),
-                        length=int(r["LENGTH"]),
-                        a=r["group.a"],
-                        b=r["group.b"],
-                        ident=float(r[identity_col]),
-                    )
-                )
-            except Exception as e:
-                # skip malformed lines
+                c, s, e, l, ra, rb, v = r[iC], int(r[iS]), int(r[iE]), int(r[iL]), r[iA], r[iB], float(r[iI])
+            except Exception as ex:
+                # skip malformed (or short) lines
                 continue
-    return rows
+            chrs.append(c); starts.append(s); ends.append(e); lengths.append(l)
+            a.append(ra); b.append(rb); ident.append(v)
+    col = lambda buf, dtype: np.frombuffer(buf, dtype=dtype)
+    return encode_table(chrs, col(starts, np.int64), col(ends, np.int64), col(lengths, np.int64),
+                        a, b, col(ident, np.float64))
+
+def encode_table(chrs, starts, ends, lengths, a, b, ident):
+    # names -> small integer codes (pandas picks the narrowest int width)
+    chrs = pd.Categorical(chrs)
+    a = pd.Categorical(a); b = pd.Categorical(b)
+    # one sorted index for both haplotype columns, so comparing codes orders pairs like names
+    # (union skips sorting when both are equal, and pyarrow dictionaries keep input order)
+    haps = a.categories.union(b.categories).sort_values()
+    return Table(chr=chrs.codes, start=starts, end=ends, length=lengths,
+                 a=a.set_categories(haps).codes, b=b.set_categories(haps).codes, ident=ident,
+                 chroms=chrs.categories.to_numpy(dtype=object), haps=haps.to_numpy(dtype=object))
 
 def pair_key(a,b):
-    return (a,b) if a<=b else (b,a)
-
-def build_windows(rows):
-    # one ordered list per chromosome (keeps windows contiguous by chr)
-    uniq = defaultdict(dict)  # chr -> {(start,end,length): None}
-    for r in rows:
-        uniq[r.chr][(r.start,r.end,r.length)] = None
-    Win = namedtuple("Win","chr start end length")
-    wins_by_chr = {}
-    index_by_chr = {}
-    for chr_, d in uniq.items():
-        wins = [Win(chr_, s, e, l) for (s,e,l) in sorted(d.keys())]
-        wins_by_chr[chr_] = wins
-        index_by_chr[chr_] = {(w.start,w.end): i for i,w in enumerate(wins)}
-    return wins_by_chr, index_by_chr
-
-def build_pair_tracks(rows, index_by_chr):
-    # per pair -> per chr -> list of (win_idx, ident)
-    tracks = defaultdict(lambda: defaultdict(list))
-    for r in rows:
-        idx = index_by_chr[r.chr].get((r.start,r.end))
-        if idx is None: continue
-        tracks[pair_key(r.a,r.b)][r.chr].append((idx, r.ident, r.length))
-    # sort by index
-    for p in tracks:
-        for chr_ in tracks[p]:
-            tracks[p][chr_].sort(key=lambda x: x[0])
-    return tracks
-
-def rle_segments_for_pair(track_list, wins, min_id, max_gap, min_windows, min_len_bp,
-                          treat_missing_as_gap=True, drop_tolerance=0.0):
-    """Simple run-length thresholding with gap tolerance (works on one chr)."""
-    ident_by_idx = {idx:ident for idx,ident,_ in track_list}
-    segments = []
-    n_wins_total = len(wins)
-
-    def qualifies(ident):
-        return (ident is not None) and (ident >= min_id or (drop_tolerance>0 and ident >= (min_id - drop_tolerance)))
-
-    i = 0
-    current = None
-    gaps = 0
-    called = 0
-    ident_sum = 0.0
-    min_ident = 1.0
-
-    while i < n_wins_total:
-        ident = ident_by_idx.get(i, None)
-        missing = (ident is None)
-        good = qualifies(ident) if not missing else False
-
-        if current is None:
-            if good:
-                current = {"start_idx": i, "end_idx": i}
-                gaps = 0; called = 1; ident_sum = ident; min_ident = ident
-        else:
-            extend_condition = good or (missing and treat_missing_as_gap)
-            if extend_condition:
-                current["end_idx"] = i
-                if missing:
-                    gaps += 1
-                else:
-                    called += 1
-                    ident_sum += ident
-                    if ident < min_ident: min_ident = ident
-                if gaps > max_gap:
-                    # finalize without including this window
-                    current["end_idx"] = i-1
-                    seg = finalize_segment(current, wins, called, ident_sum, min_ident,
-                                           min_windows, min_len_bp, gaps_allowed=max_gap)
-                    if seg: segments.append(seg)
-                    current = None; gaps=0; called=0; ident_sum=0.0; min_ident=1.0
+    # order-independent key of haplotype codes a, b (scalars or arrays): min<<32 | max
+    return (np.minimum(a,b).astype(np.int64) << 32) | np.maximum(a,b)
+
+# windows of one chromosome, sorted by start (one array per field)
+# cum_len[i] = total length of windows [0,i), so any span [s,e] covers cum_len[e+1]-cum_len[s] bp
+Windows = namedtuple("Windows", "chr starts ends cum_len")
+
+def build_windows(table):
+    # one sorted set of windows per chromosome, indexed by chr code, and the window index of
+    # every row; a window is identified by (start, end), windows sharing a start stay apart
+    wins_by_chr = []
+    row_win = np.empty(len(table.start), dtype=np.int32)
+    for c, chr_ in enumerate(table.chroms):
+        m = np.flatnonzero(table.chr == c)
+        starts, ends = table.start[m], table.end[m]
+        o = np.lexsort((ends, starts))  # stable: the first row of each window comes first
+        new = np.ones(len(o), dtype=np.bool_)
+        new[1:] = (starts[o][1:] != starts[o][:-1]) | (ends[o][1:] != ends[o][:-1])
+        row_win[m[o]] = np.cumsum(new) - 1
+        first = o[new]
+        wins_by_chr.append(Windows(chr_, starts[first], ends[first],
+                                   np.concatenate(([0], np.cumsum(table.length[m][first])))))
+    return wins_by_chr, row_win
+
+# one track per (pair, chr), pairs and their chrs in order of first appearance: track t
+# is rows bounds[t]:bounds[t+1] of win_idx/ident, sorted by window index
+Tracks = namedtuple("Tracks", "h1 h2 chr bounds win_idx ident")
+
+def build_pair_tracks(table, row_win):
+    pair = pair_key(table.a, table.b)
+    df = pd.DataFrame({"pair": pair, "chr": table.chr})
+    group = df.groupby(["pair","chr"], sort=False).ngroup().to_numpy()
+    n_groups = group.max() + 1
+    # (pair, chr) groups are numbered by first appearance; order them pair-major, keeping
+    # the first-appearance order of chrs within a pair
+    g_pair, g_chr, g_rank = (np.empty(n_groups, dtype=np.int64) for _ in range(3))
+    g_pair[group] = pair; g_chr[group] = table.chr; g_rank[group] = pd.factorize(pair)[0]
+    order = np.lexsort((np.arange(n_groups), g_rank))
+    track = np.empty(n_groups, dtype=np.int64)
+    track[order] = np.arange(n_groups)
+    track = track[group]
+    rows = np.lexsort((row_win, track))  # stable: duplicate windows keep their input order
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(track, minlength=n_groups))))
+    keys = g_pair[order]
+    return Tracks(keys >> 32, keys & 0xFFFFFFFF, g_chr[order], bounds, row_win[rows], table.ident[rows])
+
+@njit(cache=True)
+def densify(win_idx, idents, n):
+    """Scatter a sparse track onto all n windows of its chr: (ident, present) arrays."""
+    ident = np.full(n, np.nan)
+    ident[win_idx] = idents
+    present = np.zeros(n, dtype=np.bool_)
+    present[win_idx] = True
+    return ident, present
+
+@njit(cache=True)
+def _task_offsets(task_ids, bounds):
+    # output rows reserved per task: a track never yields more segments than it has windows
+    offs = np.zeros(task_ids.shape[0] + 1, dtype=np.int64)
+    for j in range(task_ids.shape[0]):
+        t = task_ids[j]
+        offs[j+1] = offs[j] + bounds[t+1] - bounds[t]
+    return offs
+
+@njit(cache=True)
+def _finalize(segs, stats, k, starts, ends, cum_len, s, e, called, gaps, ident_sum, min_ident,
+              min_windows, min_len_bp):
+    """Write windows [s,e] as output row k if it passes the filters; return the next free row."""
+    n_windows = e - s + 1
+    covered_bp = cum_len[e+1] - cum_len[s]
+    if n_windows < min_windows or covered_bp < min_len_bp:
+        return k
+    segs[k, 0] = starts[s]; segs[k, 1] = ends[e]
+    segs[k, 2] = n_windows; segs[k, 3] = covered_bp; segs[k, 4] = gaps
+    stats[k, 0] = ident_sum / called if called > 0 else 0.0
+    stats[k, 1] = min_ident
+    stats[k, 2] = called / n_windows
+    return k + 1
+
+@njit(cache=True)
+def _rle_emit(ident, present, good, starts, ends, cum_len, max_gap, min_windows, min_len_bp,
+              treat_missing_as_gap):
+    """RLE state machine over dense windows (good = present and above threshold), finalizing
+    and filtering segments in the same pass. Returns segs (start_bp, end_bp, n_windows,
+    covered_bp, n_gaps) and stats (mean_ident, min_ident, frac_called), one row per segment."""
+    n = ident.shape[0]
+    segs = np.empty((n, 5), dtype=np.int64)
+    stats = np.empty((n, 3), dtype=np.float64)
+    k = 0
+    is_open = False
+    start = 0; end = 0; gaps = 0; called = 0; ident_sum = 0.0; min_ident = 1.0
+
+    for i in range(n):
+        missing = not present[i]
+        v = ident[i]
+
+        if not is_open:
+            if good[i]:
+                is_open = True; start = i; end = i
+                gaps = 0; called = 1; ident_sum = v; min_ident = v
+        elif good[i] or (missing and treat_missing_as_gap):
+            if missing:
+                gaps += 1
+            else:
+                called += 1
+                ident_sum += v
+                if v < min_ident: min_ident = v
+            if gaps > max_gap:
+                # finalize without including this window
+                k = _finalize(segs, stats, k, starts, ends, cum_len, start, end, called, max_gap,
+                              ident_sum, min_ident, min_windows, min_len_bp)
+                is_open = False
             else:
-                seg = finalize_segment(current, wins, called, ident_sum, min_ident,
-                                       min_windows, min_len_bp, gaps_allowed=gaps)
-                if seg: segments.append(seg)
-                current = None; gaps=0; called=0; ident_sum=0.0; min_ident=1.0
-                if good:
-                    current = {"start_idx": i, "end_idx": i}
-                    gaps = 0; called = 1; ident_sum = ident; min_ident = ident
-        i += 1
-
-    if current is not None:
-        seg = finalize_segment(current, wins, called, ident_sum, min_ident,
-                               min_windows, min_len_bp, gaps_allowed=gaps)
-        if seg: segments.append(seg)
-    return segments
-
-def seed_extend_segments_for_pair(track_list, wins, seed_thr, seed_k,
+                end = i
+        else:
+            k = _finalize(segs, stats, k, starts, ends, cum_len, start, end, called, gaps,
+                          ident_sum, min_ident, min_windows, min_len_bp)
+            is_open = False
+            if good[i]:
+                is_open = True; start = i; end = i
+                gaps = 0; called = 1; ident_sum = v; min_ident = v
+
+    if is_open:
+        k = _finalize(segs, stats, k, starts, ends, cum_len, start, end, called, gaps,
+                      ident_sum, min_ident, min_windows, min_len_bp)
+    return segs[:k], stats[:k]
+
+@njit(cache=True)
+def rle_segments_for_pair(win_idx, idents, starts, ends, cum_len, min_id, max_gap, min_windows,
+                          min_len_bp, treat_missing_as_gap, drop_tolerance):
+    """Simple run-length thresholding with gap tolerance (works on one chr).
+    Returns the (segs, stats) arrays of _rle_emit."""
+    ident, present = densify(win_idx, idents, starts.shape[0])
+    # ident >= min_id or (tolerance > 0 and ident >= min_id - tolerance), as one compare
+    eff_min = min_id - drop_tolerance if drop_tolerance > 0 else min_id
+    good = present & (ident >= eff_min)
+    return _rle_emit(ident, present, good, starts, ends, cum_len, max_gap,
+                     min_windows, min_len_bp, treat_missing_as_gap)
+
+@njit(parallel=True, cache=True)
+def rle_tasks(task_ids, bounds, win_idx, idents, starts, ends, cum_len, min_id, max_gap,
+              min_windows, min_len_bp, treat_missing_as_gap, drop_tolerance):
+    """rle_segments_for_pair over the tracks task_ids of one chr, in parallel. Task j's
+    rows are segs/stats[offs[j]:offs[j]+counts[j]]."""
+    offs = _task_offsets(task_ids, bounds)
+    segs = np.empty((offs[-1], 5), dtype=np.int64)
+    stats = np.empty((offs[-1], 3), dtype=np.float64)
+    counts = np.zeros(task_ids.shape[0], dtype=np.int64)
+    for j in prange(task_ids.shape[0]):
+        lo = bounds[task_ids[j]]; hi = bounds[task_ids[j]+1]
+        s, st = rle_segments_for_pair(win_idx[lo:hi], idents[lo:hi], starts, ends, cum_len, min_id,
+                                      max_gap, min_windows, min_len_bp, treat_missing_as_gap,
+                                      drop_tolerance)
+        k = s.shape[0]
+        segs[offs[j]:offs[j]+k] = s
+        stats[offs[j]:offs[j]+k] = st
+        counts[j] = k
+    return segs, stats, offs, counts
+
+# called segments, one row each; track indexes Tracks (pair and chr)
+SEGMENT_DTYPE = np.dtype([("track","i8"), ("start","i8"), ("end","i8"), ("n_windows","i4"),
+                          ("covered_bp","i8"), ("mean_ident","f8"), ("min_ident","f8"),
+                          ("frac_called","f8"), ("n_gaps","i4")])
+
+def gather_segments(task_ids, offs, counts, segs, stats):
+    """Collect the (segs, stats) rows of rle_tasks into one SEGMENT_DTYPE array."""
+    rows = np.repeat(offs[:-1] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+    out = np.zeros(len(rows), dtype=SEGMENT_DTYPE)
+    out["track"] = np.repeat(task_ids, counts)
+    for i, f in enumerate(("start", "end", "n_windows", "covered_bp", "n_gaps")):
+        out[f] = segs[rows, i]
+    for i, f in enumerate(("mean_ident", "min_ident", "frac_called")):
+        out[f] = stats[rows, i]
+    return out
+
+def write_segments(fh, segs, table, tracks, mode, chunk=1 << 16):
+    """Write SEGMENT_DTYPE rows as the output TSV, chunk rows per write."""
+    header = ["CHR","START","END","HAP1","HAP2","N_WINDOWS","COVERED_BP","MEAN_IDENTITY","MIN_IDENTITY","FRACTION_CALLED","MODE"]
+    fh.write("\t".join(header) + "\n")
+    for i in range(0, len(segs), chunk):
+        s = segs[i:i+chunk]
+        t = s["track"]
+        cols = (table.chroms[tracks.chr[t]], s["start"].tolist(), s["end"].tolist(),
+                table.haps[tracks.h1[t]], table.haps[tracks.h2[t]],
+                s["n_windows"].tolist(), s["covered_bp"].tolist(), s["mean_ident"].tolist(),
+                s["min_ident"].tolist(), s["frac_called"].tolist())
+        fh.write("".join(
+            f"{c}\t{start}\t{end}\t{a}\t{b}\t{n_windows}\t{covered_bp}\t{mean_ident:.6f}\t{min_ident:.6f}\t{frac_called:.3f}\t{mode}\n"
+            for c, start, end, a, b, n_windows, covered_bp, mean_ident, min_ident, frac_called in zip(*cols)))
+
+@njit(cache=True)
+def _xdrop(scores, origin, step, xdrop):
+    """Extend from origin in direction step (+1/-1) over the per-window extension scores;
+    return the best-scoring boundary."""
+    n = scores.shape[0]
+    best = origin
+    score = 0.0
+    best_score = 0.0
+    k = origin + step
+    while k >= 0 and k < n:
+        score += scores[k]
+        if score > best_score:
+            best_score = score
+            best = k
+        # x-drop stop
+        if best_score - score > xdrop:
+            break
+        k += step
+    return best
+
+@njit(cache=True)
+def _seed_extend(scores, cum_len, seeds, xdrop, min_windows, min_len_bp):
+    """Extend each (s, e) seed over the extension scores; return the (start_idx, end_idx)
+    of segments passing the filters."""
+    n = scores.shape[0]
+    used = np.zeros(n, dtype=np.bool_)  # windows already assigned to a called seg, avoids duplicates
+    segs = np.empty((seeds.shape[0], 2), dtype=np.int64)
+    k = 0
+    for j in range(seeds.shape[0]):
+        s = seeds[j, 0]; e = seeds[j, 1]
+        # skip if fully covered by a previous segment
+        if np.all(used[s:e+1]):
+            continue
+        left = _xdrop(scores, s, -1, xdrop)
+        right = _xdrop(scores, e, 1, xdrop)
+        if right - left + 1 >= min_windows and cum_len[right+1] - cum_len[left] >= min_len_bp:
+            segs[k, 0] = left; segs[k, 1] = right
+            k += 1
+            used[left:right+1] = True
+    return segs[:k]
+
+@njit(cache=True)
+def find_seeds(good, seed_k):
+    """Runs of >= seed_k consecutive good windows, as (start_idx, end_idx) inclusive rows."""
+    padded = np.zeros(good.shape[0] + 2, dtype=np.int8)
+    padded[1:-1] = good
+    edges = np.diff(padded)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    keep = ends - starts + 1 >= seed_k
+    return np.stack((starts[keep], ends[keep]), axis=1)
+
+@njit(cache=True)
+def seed_extend_segments_for_pair(win_idx, idents, cum_len, seed_thr, seed_k,
                                   ext_thr, xdrop, reward, pen_bad, pen_miss,
-                                  min_windows, min_len_bp, treat_missing_as_gap=True):
+                                  min_windows, min_len_bp, treat_missing_as_gap):
     """Seed-and-extend (x-drop) per chromosome: 
        1) find seeds = runs of >= seed_k windows with ident >= seed_thr
        2) extend left/right using x-drop on a simple scoring scheme
+    Returns the (start_idx, end_idx) of the segments passing the filters, see
+    summarize_seed_segments for their final form.
     """
-    ident_by_idx = {idx:ident for idx,ident,_ in track_list}
-    n = len(wins)
-    used = [False]*n  # optional: mark windows already assigned to a called seg to avoid duplicates
-    segments = []
-
-    # helper to classify a window
-    def classify(i):
-        ident = ident_by_idx.get(i, None)
-        if ident is None:
-            return None, True  # missing
-        return ident, False
-
-    # find seeds: runs with ident >= seed_thr
-    i = 0
-    seeds = []
-    while i < n:
-        ident = ident_by_idx.get(i, None)
-        if ident is not None and ident >= seed_thr:
-            j = i
-            run = 0
-            while j < n and ident_by_idx.get(j, None) is not None and ident_by_idx[j] >= seed_thr:
-                run += 1; j += 1
-            if run >= seed_k:
-                seeds.append( (i, j-1) )  # inclusive indices
-            i = j
-        else:
-            i += 1
+    ident, present = densify(win_idx, idents, cum_len.shape[0] - 1)
+    good_seed = present & (ident >= seed_thr)
+    seeds = find_seeds(good_seed, seed_k)
+    # score each window once for all seeds: reward good, penalize bad/missing; a skipped
+    # missing window scores 0, which can neither raise the best score nor trigger the x-drop
+    good_ext = present & (ident >= ext_thr)
+    miss = -pen_miss if treat_missing_as_gap else 0.0
+    scores = np.where(good_ext, reward, np.where(present, -pen_bad, miss))
+    return _seed_extend(scores, cum_len, seeds, xdrop, min_windows, min_len_bp)
 
-    # extend each seed (skip overlapping processed areas)
-    for (s, e) in seeds:
-        # skip if fully covered by a previous segment (optional)
-        if all(used[k] for k in range(s, e+1)):
-            continue
+@njit(parallel=True, cache=True)
+def seed_tasks(task_ids, bounds, win_idx, idents, cum_len, seed_thr, seed_k, ext_thr, xdrop,
+               reward, pen_bad, pen_miss, min_windows, min_len_bp, treat_missing_as_gap):
+    """seed_extend_segments_for_pair over the tracks task_ids of one chr, in parallel.
+    Task j's (start_idx, end_idx) rows are segs[offs[j]:offs[j]+counts[j]]."""
+    offs = _task_offsets(task_ids, bounds)
+    segs = np.empty((offs[-1], 2), dtype=np.int64)
+    counts = np.zeros(task_ids.shape[0], dtype=np.int64)
+    for j in prange(task_ids.shape[0]):
+        lo = bounds[task_ids[j]]; hi = bounds[task_ids[j]+1]
+        s = seed_extend_segments_for_pair(win_idx[lo:hi], idents[lo:hi], cum_len, seed_thr, seed_k,
+                                          ext_thr, xdrop, reward, pen_bad, pen_miss,
+                                          min_windows, min_len_bp, treat_missing_as_gap)
+        k = s.shape[0]
+        segs[offs[j]:offs[j]+k] = s
+        counts[j] = k
+    return segs, offs, counts
 
-        # extend left
-        best_left = s
-        score = 0.0
-        best_score = 0.0
-        k = s - 1
-        while k >= 0:
-            ident, missing = classify(k)
-            if missing and not treat_missing_as_gap:
-                k -= 1
-                continue
-            if missing:
-                score -= pen_miss
-            else:
-                if ident >= ext_thr:
-                    score += reward
-                else:
-                    score -= pen_bad
-            if score > best_score:
-                best_score = score
-                best_left = k
-            # x-drop stop
-            if best_score - score > xdrop:
-                break
-            k -= 1
-
-        # extend right
-        best_right = e
-        score = 0.0
-        best_score = 0.0
-        k = e + 1
-        while k < n:
-            ident, missing = classify(k)
-            if missing and not treat_missing_as_gap:
-                k += 1
-                continue
-            if missing:
-                score -= pen_miss
-            else:
-                if ident >= ext_thr:
-                    score += reward
-                else:
-                    score -= pen_bad
-            if score > best_score:
-                best_score = score
-                best_right = k
-            if best_score - score > xdrop:
-                break
-            k += 1
+def summarize_seed_segments(track, win_idx, idents, wins, segs):
+    """SEGMENT_DTYPE rows for the (start_idx, end_idx) seed segments of one track, merged."""
+    ident, present = densify(win_idx, idents, len(wins.starts))
+    cum = prefix_sums(ident, present)
+    mins = sparse_min_table(np.where(present, ident, np.inf))
+    # merge overlapping/adjacent segments (optional minor cleanup), then summarize the merged spans
+    merged = merge_segments(segs.tolist(), wins)
+    out = np.zeros(len(merged), dtype=SEGMENT_DTYPE)
+    out["track"] = track
+    for k, (s, e) in enumerate(merged):
+        summarize_segment(s, e, wins, cum, mins, out, k)
+    return out
+
+def prefix_sums(ident, present):
+    """Cumulative called identity, called count and NaN-identity count (leading 0), so
+    that any span [s,e] sums to cum[e+1]-cum[s]. NaN identities are counted apart, so one
+    only turns the mean of the spans holding it into NaN."""
+    is_nan = present & np.isnan(ident)
+    cum_ident = np.concatenate(([0.0], np.cumsum(np.where(present & ~is_nan, ident, 0.0))))
+    cum_called = np.concatenate(([0], np.cumsum(present)))
+    cum_nan = np.concatenate(([0], np.cumsum(is_nan)))
+    return cum_ident, cum_called, cum_nan
 
-        # finalize candidate
-        seg = summarize_segment(best_left, best_right, wins, ident_by_idx)
-        if seg["n_windows"] >= min_windows and seg["covered_bp"] >= min_len_bp:
-            segments.append(seg)
-            for k in range(best_left, best_right+1):
-                used[k] = True
+@njit(cache=True)
+def sparse_min_table(vals):
+    """Sparse table for O(1) range minimum: row j holds min(vals[i:i+2**j]) at column i.
+    NaN values are skipped (fmin), as Python's min over a run starting at a called window."""
+    n = vals.shape[0]
+    levels = 1
+    while (1 << levels) <= n:
+        levels += 1
+    table = np.full((levels, n), np.inf)
+    table[0] = vals
+    for j in range(1, levels):
+        h = 1 << (j - 1)
+        m = n - 2*h + 1
+        table[j, :m] = np.fmin(table[j-1, :m], table[j-1, h:h+m])
+    return table
 
-    # merge overlapping/adjacent segments (optional minor cleanup)
-    segments = merge_segments(segments, wins)
-    return segments
+@njit(cache=True)
+def range_min(table, s, e):
+    """min(vals[s:e+1]) from a sparse_min_table, as the min of two overlapping power-of-2 spans."""
+    j = 0
+    while (2 << j) <= e - s + 1:
+        j += 1
+    return np.fmin(table[j, s], table[j, e - (1 << j) + 1])
 
-def summarize_segment(s, e, wins, ident_by_idx):
-    start_bp = wins[s].start; end_bp = wins[e].end
+def summarize_segment(s, e, wins, cum, mins, out, k):
+    """Fill out[k] with the summary of windows [s,e]."""
+    cum_ident, cum_called, cum_nan = cum
     n_windows = e - s + 1
-    covered_bp = sum(w.length for w in wins[s:e+1])
-    called_idents = [ident_by_idx[i] for i in range(s, e+1) if i in ident_by_idx]
-    mean_ident = sum(called_idents)/len(called_idents) if called_idents else 0.0
-    min_ident = min(called_idents) if called_idents else 0.0
-    frac_called = len(called_idents)/n_windows if n_windows>0 else 0.0
-    return {
-        "chr": wins[s].chr,
-        "start": start_bp,
-        "end": end_bp,
-        "n_windows": n_windows,
-        "covered_bp": covered_bp,
-        "mean_ident": mean_ident,
-        "min_ident": min_ident,
-        "frac_called": frac_called
-    }
+    called = int(cum_called[e+1] - cum_called[s])
+    row = out[k]
+    row["start"] = wins.starts[s]; row["end"] = wins.ends[e]
+    row["n_windows"] = n_windows
+    row["covered_bp"] = wins.cum_len[e+1] - wins.cum_len[s]
+    if cum_nan[e+1] - cum_nan[s] > 0:
+        row["mean_ident"] = np.nan
+    else:
+        row["mean_ident"] = (cum_ident[e+1] - cum_ident[s])/called if called else 0.0
+    row["min_ident"] = range_min(mins, s, e) if called else 0.0
+    row["frac_called"] = called/n_windows if n_windows>0 else 0.0
 
 def merge_segments(segs, wins):
-    if not segs: return []
-    segs = sorted(segs, key=lambda s:(s["chr"], s["start"], s["end"]))
-    out = [segs[0]]
-    for s in segs[1:]:
-        last = out[-1]
-        if s["chr"]==last["chr"] and s["start"] <= last["end"]:
-            # merge
-            last["start"] = min(last["start"], s["start"])
-            last["end"] = max(last["end"], s["end"])
-            # recompute stats approximately via windows span (not re-averaging idents)
+    """Merge (start_idx, end_idx) segments that overlap or touch in bp. Seeds are extended
+    in ascending order and a later seed never extends left of an earlier segment, so segs
+    are already sorted by start and one sweep suffices."""
+    out = []
+    for s, e in segs:
+        if out and wins.starts[s] <= wins.ends[out[-1][1]]:
+            out[-1][1] = max(out[-1][1], e)
         else:
-            out.append(s)
+            out.append([s, e])
     return out
 
-def finalize_segment(current, wins, called, ident_sum, min_ident,
-                     min_windows, min_len_bp, gaps_allowed=0, **kwargs):
-    s = current["start_idx"]; e = current["end_idx"]
-    n_windows = e - s + 1
-    start_bp = wins[s].start; end_bp = wins[e].end
-    covered_bp = sum(w.length for w in wins[s:e+1])
-    mean_ident = (ident_sum / called) if called>0 else 0.0
-    frac_called = called / n_windows if n_windows>0 else 0.0
-
-    if n_windows >= min_windows and covered_bp >= min_len_bp:
-        return {
-          "chr": wins[s].chr,
-          "start": start_bp,
-          "end": end_bp,
-          "n_windows": n_windows,
-          "covered_bp": covered_bp,
-          "mean_ident": mean_ident,
-          "min_ident": min_ident,
-          "n_gaps": gaps_allowed,
-          "frac_called": frac_called
-        }
-    return None
-
 def main():
     ap = argparse.ArgumentParser(description="Call IBD segments from per-window pairwise identities")
     ap.add_argument("pairwise_tsv", help="Output of run_pairwise_impg.sh")
@@ -303,59 +472,55 @@ def main():
     ap.add_argument("--pairs", help="Optional file with pairs A<TAB>B to restrict analysis")
     args = ap.parse_args()
 
-    rows = parse_table(args.pairwise_tsv, identity_col=args.identity_col)
-    if not rows:
+    table = parse_table(args.pairwise_tsv, identity_col=args.identity_col)
+    if not len(table.chr):
         print("No valid rows", file=sys.stderr); sys.exit(1)
-    wins_by_chr, index_by_chr = build_windows(rows)
-    tracks = build_pair_tracks(rows, index_by_chr)
+    wins_by_chr, row_win = build_windows(table)
+    tracks = build_pair_tracks(table, row_win)
 
-    pair_filter = None
+    keep = np.ones(len(tracks.chr), dtype=np.bool_)
     if args.pairs:
-        pair_filter = set()
+        code = {h: i for i, h in enumerate(table.haps)}
+        pair_filter, n_pairs = set(), 0
         with open(args.pairs) as fh:
             for line in fh:
                 if not line.strip() or line.startswith("#"): continue
                 a,b = line.rstrip("\n").split("\t")[:2]
-                pair_filter.add(pair_key(a,b))
+                n_pairs += 1
+                if a in code and b in code:  # pairs absent from the table match nothing
+                    pair_filter.add(int(pair_key(code[a], code[b])))
+        if n_pairs:
+            keep = np.isin(pair_key(tracks.h1, tracks.h2), list(pair_filter))
 
-    w = csv.writer(sys.stdout, delimiter="\t", lineterminator="\n")
-    header = ["CHR","START","END","HAP1","HAP2","N_WINDOWS","COVERED_BP","MEAN_IDENTITY","MIN_IDENTITY","FRACTION_CALLED","MODE"]
-    w.writerow(header)
+    # tracks of one chr share its windows and run in parallel
+    parts = [np.zeros(0, dtype=SEGMENT_DTYPE)]
+    for c, wins in enumerate(wins_by_chr):
+        task_ids = np.flatnonzero(keep & (tracks.chr == c))
+        if args.mode == "rle":
+            segs, stats, offs, counts = rle_tasks(
+                task_ids, tracks.bounds, tracks.win_idx, tracks.ident,
+                wins.starts, wins.ends, wins.cum_len,
+                args.min_identity, args.max_gap, args.min_windows, args.min_length_bp,
+                args.missing_as_gap, args.drop_tolerance
+            )
+            parts.append(gather_segments(task_ids, offs, counts, segs, stats))
+        else:
+            segs, offs, counts = seed_tasks(
+                task_ids, tracks.bounds, tracks.win_idx, tracks.ident, wins.cum_len,
+                args.seed_threshold, args.seed_k, args.extend_threshold, args.xdrop,
+                args.reward, args.penalty_bad, args.penalty_miss,
+                args.min_windows, args.min_length_bp, args.missing_as_gap
+            )
+            for j, t in enumerate(task_ids.tolist()):
+                if not counts[j]: continue
+                lo, hi = tracks.bounds[t], tracks.bounds[t+1]
+                parts.append(summarize_seed_segments(t, tracks.win_idx[lo:hi], tracks.ident[lo:hi], wins,
+                                                     segs[offs[j]:offs[j]+counts[j]]))
 
-    for (a,b), tracks_by_chr in tracks.items():
-        if pair_filter and pair_key(a,b) not in pair_filter:
-            continue
-        for chr_, track in tracks_by_chr.items():
-            wins = wins_by_chr[chr_]
-            if args.mode == "rle":
-                segs = rle_segments_for_pair(
-                    track, wins,
-                    min_id=args.min_identity,
-                    max_gap=args.max_gap,
-                    min_windows=args.min_windows,
-                    min_len_bp=args.min_length_bp,
-                    treat_missing_as_gap=args.missing_as_gap,
-                    drop_tolerance=args.drop_tolerance
-                )
-            else:
-                segs = seed_extend_segments_for_pair(
-                    track, wins,
-                    seed_thr=args.seed_threshold,
-                    seed_k=args.seed_k,
-                    ext_thr=args.extend_threshold,
-                    xdrop=args.xdrop,
-                    reward=args.reward,
-                    pen_bad=args.penalty_bad,
-                    pen_miss=args.penalty_miss,
-                    min_windows=args.min_windows,
-                    min_len_bp=args.min_length_bp,
-                    treat_missing_as_gap=args.missing_as_gap
-                )
-            for s in segs:
-                w.writerow([chr_, s["start"], s["end"], a, b,
-                            s["n_windows"], s["covered_bp"],
-                            f"{s['mean_ident']:.6f}", f"{s['min_ident']:.6f}",
-                            f"{s['frac_called']:.3f}", args.mode])
+    segments = np.concatenate(parts)
+    # back to track order (pairs, then chrs, in order of first appearance)
+    segments = segments[np.argsort(segments["track"], kind="stable")]
+    write_segments(sys.stdout, segments, table, tracks, args.mode)
 
 if __name__ == "__main__":
     main()